@@ -7,6 +7,8 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 class Settings(BaseSettings):
     WORK_DIR: str = "/opt/ytms"
     STORAGE_ROOT: str = "/var/www/yurtube/storage"
+    SCRATCH_DIR: str = "/tmp/ytms"
+    DIAG_DIR: str = "/opt/ytms/diagnostics"
     WORKERS: int = 1
 
     GLOBAL_AUTH_TOKEN: str = "dev-secret"
@@ -25,6 +27,12 @@ class Settings(BaseSettings):
     MAX_FRAMES: int = 1000
     MIN_INTERVAL_SEC: float = 0.2
 
+    SPRITE_QUEUE_SIZE: int = 2
+
+    PREVIEW_CLIP_FRAMES: int = 24
+    PREVIEW_CLIP_FRAME_MS: int = 250
+    PREVIEW_CLIP_QUALITY: int = 70
+
     model_config = SettingsConfigDict(
         env_prefix="YTMS_",
         env_file=".env",
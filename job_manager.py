@@ -1,3 +1,5 @@
+import os
+import time
 import asyncio
 import json
 from typing import Dict, Any, Optional
@@ -10,6 +12,7 @@ from schemas import (
     ThumbnailsJobResult,
 )
 from utils.utils_ut import generate_thumbnails_pipeline
+from utils.profiling_ut import JobProfiler
 from config import settings
 
 
@@ -18,6 +21,7 @@ class JobManager:
         self.jobs: Dict[str, Dict[str, Any]] = {}
         self.queue: asyncio.Queue = asyncio.Queue()
         self._shutdown = False
+        self.profile_armed = 0
 
 
     async def submit_thumbnails(self, data: ThumbnailsJobCreate) -> JobInfo:
@@ -28,6 +32,8 @@ class JobManager:
             "status": "queued",
             "error": None,
             "result": None,
+            "diagnostics": None,
+            "submitted_at": time.perf_counter(),
             "payload": data.model_dump(),
         }
         self.jobs[job_id] = record
@@ -55,9 +61,23 @@ class JobManager:
             status=rec["status"],
             error=rec["error"],
             result=result_obj,
+            diagnostics=rec["diagnostics"],
         )
 
 
+    def arm_profiling(self, jobs: int) -> int:
+        self.profile_armed = max(0, jobs)
+        print(f"[PROFILE ARMED] next_jobs={self.profile_armed}")
+        return self.profile_armed
+
+
+    def diagnostics_path(self, job_id: str, name: str) -> Optional[str]:
+        rec = self.jobs.get(job_id)
+        if not rec or not rec["diagnostics"] or name not in rec["diagnostics"]:
+            return None
+        return os.path.join(settings.DIAG_DIR, job_id, name)
+
+
     async def run_workers(self, num_workers: int = 1):
         workers = [asyncio.create_task(self._worker_loop(i)) for i in range(max(1, num_workers))]
         try:
@@ -106,17 +126,45 @@ class JobManager:
     async def _process_thumbnails(self, job_id: str, payload: Dict[str, Any]):
         data = ThumbnailsJobCreate(**payload)
         print(f"[PIPELINE START] job_id={job_id} video_id={data.video_id}")
-        pipeline_result = await generate_thumbnails_pipeline(
-            video_id=data.video_id,
-            out_base_path=data.out_base_path,
-            src_path=data.src_path,
-            src_url=data.src_url,
-            interval_sec=data.interval_sec,
-            tile_w=data.tile_w,
-            tile_h=data.tile_h,
-            cols=data.cols,
-            rows=data.rows,
-        )
+        profiler = None
+        if data.profile or self.profile_armed > 0:
+            if not data.profile:
+                self.profile_armed -= 1
+            profiler = JobProfiler(job_id, os.path.join(settings.DIAG_DIR, job_id))
+            try:
+                profiler.start()
+                rec = self.jobs.get(job_id)
+                if rec is not None:
+                    profiler.stage_done("queue_wait", time.perf_counter() - rec["submitted_at"])
+            except Exception as e:
+                print(f"[PROFILE ERROR] job_id={job_id} start error={e}")
+                profiler = None
+        try:
+            pipeline_result = await generate_thumbnails_pipeline(
+                video_id=data.video_id,
+                out_base_path=data.out_base_path,
+                src_path=data.src_path,
+                src_url=data.src_url,
+                interval_sec=data.interval_sec,
+                tile_w=data.tile_w,
+                tile_h=data.tile_h,
+                cols=data.cols,
+                rows=data.rows,
+                preview_clip=data.preview_clip,
+                profiler=profiler,
+            )
+        finally:
+            if profiler is not None:
+                try:
+                    artifacts = profiler.finish()
+                except Exception as e:
+                    print(f"[PROFILE ERROR] job_id={job_id} finish error={e}")
+                    artifacts = dict(profiler.artifacts)
+                rec = self.jobs.get(job_id)
+                if rec is not None and artifacts:
+                    rec["diagnostics"] = {
+                        name: f"/api/jobs/{job_id}/diagnostics/{name}" for name in sorted(artifacts)
+                    }
         sprites_struct = [
             {"path": sp["path"], "index": i}
             for i, sp in enumerate(pipeline_result["sprites"])
@@ -128,6 +176,7 @@ class JobManager:
         result_obj = {
             "sprites": sprites_struct,
             "vtt": vtt_struct,
+            "preview": pipeline_result.get("preview"),
         }
 
         rec = self.jobs.get(job_id)
@@ -148,6 +197,8 @@ class JobManager:
             "vtt": {"path": result_obj["vtt"]["path"], "meta": result_obj["vtt"]["meta"]},
             "sprites": [{"path": s["path"], "index": s["index"]} for s in result_obj["sprites"]],
         }
+        if result_obj["preview"]:
+            body["preview"] = result_obj["preview"]
         raw = json.dumps(body).encode("utf-8")
         sig = settings.sign(data.auth_token, raw)
         async with httpx.AsyncClient(timeout=60.0) as client:
@@ -3,6 +3,7 @@ from fastapi import FastAPI
 from config import settings
 from job_manager import JobManager
 from routes.thumbnails_rout import router as thumbnails_router
+from routes.admin_rout import router as admin_router
 
 app = FastAPI(title="YT Media Service (ytms)", version="0.1.0")
 
@@ -21,6 +22,7 @@ async def shutdown_event():
 
 
 app.include_router(thumbnails_router, prefix="/api")
+app.include_router(admin_router, prefix="/api")
 
 
 @app.get("/healthz")
@@ -0,0 +1,20 @@
+import hmac
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from config import settings
+from schemas import ProfileArmRequest, ProfileArmInfo
+
+router = APIRouter(tags=["admin"])
+
+
+def require_admin_token(authorization: Optional[str] = Header(None)):
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip(), settings.GLOBAL_AUTH_TOKEN):
+        raise HTTPException(status_code=401, detail="unauthorized", headers={"WWW-Authenticate": "Bearer"})
+
+
+@router.post("/admin/profile", response_model=ProfileArmInfo, dependencies=[Depends(require_admin_token)])
+async def arm_profiling(data: ProfileArmRequest, request: Request):
+    jm = request.app.state.job_manager
+    armed = jm.arm_profiling(data.jobs)
+    return ProfileArmInfo(armed=armed)
@@ -1,5 +1,7 @@
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import FileResponse
 from schemas import ThumbnailsJobCreate, JobInfo
+from routes.admin_rout import require_admin_token
 
 router = APIRouter(tags=["thumbnails"])
 
@@ -21,4 +23,13 @@ async def get_job(job_id: str, request: Request):
     info = await jm.get_job(job_id)
     if not info:
         raise HTTPException(status_code=404, detail="job_not_found")
-    return info
\ No newline at end of file
+    return info
+
+
+@router.get("/jobs/{job_id}/diagnostics/{name}", dependencies=[Depends(require_admin_token)])
+async def get_job_diagnostics(job_id: str, name: str, request: Request):
+    jm = request.app.state.job_manager
+    path = jm.diagnostics_path(job_id, name)
+    if not path:
+        raise HTTPException(status_code=404, detail="diagnostics_not_found")
+    return FileResponse(path, filename=name)
\ No newline at end of file
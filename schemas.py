@@ -19,6 +19,9 @@ class ThumbnailsJobCreate(BaseModel):
     callback_url: Optional[str] = None
     auth_token: Optional[str] = None
 
+    preview_clip: bool = False
+    profile: bool = False
+
 
 class SpriteInfo(BaseModel):
     path: str
@@ -30,9 +33,16 @@ class VTTInfo(BaseModel):
     meta: Dict[str, Any]
 
 
+class PreviewClipInfo(BaseModel):
+    path: str
+    size_bytes: int
+    frames: int
+
+
 class ThumbnailsJobResult(BaseModel):
     sprites: List[SpriteInfo]
     vtt: VTTInfo
+    preview: Optional[PreviewClipInfo] = None
 
 
 class JobInfo(BaseModel):
@@ -40,4 +50,13 @@ class JobInfo(BaseModel):
     kind: Literal["thumbnails"]
     status: JobStatus
     error: Optional[str] = None
-    result: Optional[ThumbnailsJobResult] = None
\ No newline at end of file
+    result: Optional[ThumbnailsJobResult] = None
+    diagnostics: Optional[Dict[str, str]] = None
+
+
+class ProfileArmRequest(BaseModel):
+    jobs: int = Field(1, ge=0, le=1000)
+
+
+class ProfileArmInfo(BaseModel):
+    armed: int
\ No newline at end of file
@@ -0,0 +1,365 @@
+import os
+import sys
+import json
+import time
+import uuid
+import hmac
+import asyncio
+import argparse
+import statistics
+import subprocess
+from typing import List, Dict, Any, Optional
+
+import httpx
+
+from config import settings
+
+
+def pct(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    vals = sorted(values)
+    k = min(len(vals) - 1, max(0, int(round(p / 100.0 * (len(vals) - 1)))))
+    return vals[k]
+
+
+def summarize(values: List[float]) -> Dict[str, Any]:
+    if not values:
+        return {"n": 0}
+    return {
+        "n": len(values),
+        "p50": round(pct(values, 50), 4),
+        "p90": round(pct(values, 90), 4),
+        "p99": round(pct(values, 99), 4),
+        "max": round(max(values), 4),
+        "mean": round(statistics.fmean(values), 4),
+    }
+
+
+async def make_lavfi_video(work_dir: str, duration: int, size: str, rate: int) -> str:
+    os.makedirs(work_dir, exist_ok=True)
+    path = os.path.join(work_dir, f"lavfi_{duration}s_{size}_{rate}fps.mp4")
+    if os.path.exists(path):
+        return path
+    cmd = [
+        "ffmpeg", "-y", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size={size}:rate={rate}",
+        "-t", str(duration),
+        "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p",
+        path,
+    ]
+    proc = await asyncio.create_subprocess_exec(*cmd, stderr=asyncio.subprocess.PIPE)
+    _, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(f"lavfi generation failed: {stderr.decode('utf-8', 'ignore')[:500]}")
+    print(f"[LAVFI] {path}")
+    return path
+
+
+class CallbackReceiver:
+    # stand-in for the yurtube callback endpoint; checks X-Signature like yurtube does
+
+    def __init__(self, host: str, port: int, token: str):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.received: Dict[str, Dict[str, Any]] = {}
+        self.bad_signatures = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/callback"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        print(f"[CALLBACK SERVER] listening {self.url}")
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            headers = {}
+            for line in head.decode("latin-1").split("\r\n")[1:]:
+                if ":" in line:
+                    k, v = line.split(":", 1)
+                    headers[k.strip().lower()] = v.strip()
+            body = await reader.readexactly(int(headers.get("content-length", "0")))
+            now = time.perf_counter()
+            expected = settings.sign(self.token, body)
+            sig_ok = hmac.compare_digest(expected, headers.get("x-signature", ""))
+            if not sig_ok:
+                self.bad_signatures += 1
+            payload = json.loads(body or b"{}")
+            self.received[payload.get("video_id", "")] = {"t": now, "sig_ok": sig_ok, "payload": payload}
+            status = b"200 OK" if sig_ok else b"401 Unauthorized"
+            writer.write(b"HTTP/1.1 " + status + b"\r\nContent-Length: 2\r\nConnection: close\r\n\r\nok")
+            await writer.drain()
+        except Exception as e:
+            print("[CALLBACK SERVER ERROR]", e)
+        finally:
+            writer.close()
+
+
+def schedule(pattern: str, jobs: int, rate: float, ramp_step_sec: float) -> List[float]:
+    # offsets in seconds from start at which each job is submitted
+    if pattern == "burst":
+        return [0.0] * jobs
+    if pattern == "steady":
+        return [i / rate for i in range(jobs)]
+    # ramp: step k runs at rate*(k+1); fractional jobs carry over so long-run counts match the rate
+    offsets = []
+    t = 0.0
+    step = 0
+    owed = 0.0
+    while len(offsets) < jobs:
+        step_rate = rate * (step + 1)
+        owed += step_rate * ramp_step_sec
+        n = int(owed + 1e-9)
+        owed -= n
+        for i in range(n):
+            offsets.append(t + i * ramp_step_sec / n)
+        t += ramp_step_sec
+        step += 1
+    return offsets[:jobs]
+
+
+def step_counts(offsets: List[float], ramp_step_sec: float) -> List[int]:
+    # jobs actually scheduled in each ramp step
+    counts: List[int] = []
+    for off in offsets:
+        k = int(off // ramp_step_sec)
+        counts.extend([0] * (k + 1 - len(counts)))
+        counts[k] += 1
+    return counts
+
+
+async def run_load(args, base_url: str, receiver: CallbackReceiver, videos: List[str]) -> Dict[str, Any]:
+    offsets = schedule(args.pattern, args.jobs, args.rate, args.ramp_step_sec)
+    submit_lat: List[float] = []
+    get_lat: List[float] = []
+    health_lat: List[float] = []
+    submitted: Dict[str, Dict[str, Any]] = {}
+    depth_series: List[Dict[str, Any]] = []
+    errors = 0
+    get_errors = 0
+    done = asyncio.Event()
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=30.0) as client:
+        t_start = time.perf_counter()
+
+        async def submit(i: int, offset: float):
+            nonlocal errors
+            await asyncio.sleep(max(0.0, t_start + offset - time.perf_counter()))
+            video_id = f"lt-{uuid.uuid4().hex[:12]}"
+            body = {
+                "video_id": video_id,
+                "src_path": videos[i % len(videos)],
+                "out_base_path": os.path.join(args.out_dir, video_id),
+                "callback_url": receiver.url,
+                "auth_token": receiver.token,
+                "preview_clip": args.preview_clip,
+            }
+            t0 = time.perf_counter()
+            try:
+                r = await client.post("/api/jobs/thumbnails", json=body)
+                r.raise_for_status()
+            except Exception as e:
+                errors += 1
+                print("[SUBMIT ERROR]", e)
+                return
+            submit_lat.append(time.perf_counter() - t0)
+            submitted[video_id] = {"job_id": r.json()["job_id"], "t": t0, "offset": offset}
+
+        async def poll_jobs():
+            nonlocal get_errors
+            while not done.is_set():
+                counts = {"queued": 0, "running": 0, "succeeded": 0, "failed": 0}
+                for rec in list(submitted.values()):
+                    if rec.get("final"):
+                        counts[rec["final"]] += 1
+                        continue
+                    t0 = time.perf_counter()
+                    try:
+                        r = await client.get(f"/api/jobs/{rec['job_id']}")
+                    except Exception:
+                        continue
+                    get_lat.append(time.perf_counter() - t0)
+                    if r.status_code != 200:
+                        get_errors += 1
+                        continue
+                    info = r.json()
+                    counts[info["status"]] += 1
+                    if info["status"] in ("succeeded", "failed"):
+                        rec["final"] = info["status"]
+                        rec["meta"] = ((info.get("result") or {}).get("vtt") or {}).get("meta") or {}
+                depth_series.append({"t": round(time.perf_counter() - t_start, 2), **counts})
+                await asyncio.sleep(args.poll_sec)
+
+        async def probe_health():
+            # /healthz does no work, so its latency is dominated by service event-loop lag
+            while not done.is_set():
+                t0 = time.perf_counter()
+                try:
+                    await client.get("/healthz")
+                    health_lat.append(time.perf_counter() - t0)
+                except Exception:
+                    pass
+                await asyncio.sleep(args.poll_sec / 4)
+
+        pollers = [asyncio.create_task(poll_jobs()), asyncio.create_task(probe_health())]
+        await asyncio.gather(*(submit(i, off) for i, off in enumerate(offsets)))
+        deadline = time.perf_counter() + args.timeout
+        while time.perf_counter() < deadline:
+            if all(vid in receiver.received for vid in submitted):
+                break
+            await asyncio.sleep(0.2)
+        done.set()
+        await asyncio.gather(*pollers)
+        t_end = time.perf_counter()
+
+    cb_lat = [receiver.received[v]["t"] - rec["t"] for v, rec in submitted.items() if v in receiver.received]
+    ok = [v for v in submitted if receiver.received.get(v, {}).get("payload", {}).get("status") == "succeeded"]
+    cb_times = [receiver.received[v]["t"] for v in ok]
+    throughput = 0.0
+    if len(cb_times) > 1:
+        throughput = len(cb_times) / (max(cb_times) - t_start)
+    preview_enc = [rec["meta"]["preview_encode_sec"] for rec in submitted.values() if "preview_encode_sec" in rec.get("meta", {})]
+
+    return {
+        "pattern": args.pattern,
+        "jobs": args.jobs,
+        "submit_errors": errors,
+        "get_job_errors": get_errors,
+        "callbacks": len(cb_lat),
+        "succeeded": len(ok),
+        "bad_signatures": receiver.bad_signatures,
+        "wall_sec": round(t_end - t_start, 3),
+        "throughput_jobs_per_sec": round(throughput, 4),
+        "submit_latency": summarize(submit_lat),
+        "get_job_latency": summarize(get_lat),
+        "loop_lag_healthz": summarize(health_lat),
+        "submit_to_callback": summarize(cb_lat),
+        "preview_encode_sec": summarize(preview_enc),
+        "max_queue_depth": max((d["queued"] for d in depth_series), default=0),
+        "ramp_offered_rates": [round(c / args.ramp_step_sec, 4) for c in step_counts(offsets, args.ramp_step_sec)] if args.pattern == "ramp" else None,
+        "saturation": saturation_point(args, offsets, depth_series),
+        "queue_series": depth_series,
+    }
+
+
+def saturation_point(args, offsets: List[float], depth_series: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    # ramp only: first step whose closing queue depth grows over the previous step
+    if args.pattern != "ramp" or not depth_series:
+        return None
+    counts = step_counts(offsets, args.ramp_step_sec)
+    prev = 0
+    step = 0
+    while True:
+        t_end = (step + 1) * args.ramp_step_sec
+        in_step = [d for d in depth_series if d["t"] <= t_end]
+        if not in_step or in_step[-1]["t"] < step * args.ramp_step_sec:
+            return None
+        depth = in_step[-1]["queued"]
+        if step > 0 and depth > prev:
+            count = counts[step] if step < len(counts) else 0
+            return {"step": step, "jobs_in_step": count, "offered_rate": round(count / args.ramp_step_sec, 4), "queued": depth}
+        prev = depth
+        step += 1
+
+
+async def wait_healthy(base_url: str, timeout: float = 30.0):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(base_url=base_url, timeout=2.0) as client:
+        while time.perf_counter() < deadline:
+            try:
+                if (await client.get("/healthz")).status_code == 200:
+                    return
+            except Exception:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"service not healthy at {base_url}")
+
+
+def spawn_service(workers: int, port: int) -> subprocess.Popen:
+    env = dict(os.environ, YTMS_WORKERS=str(workers), PYTHONUNBUFFERED="1")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    print(f"[SPAWN] WORKERS={workers} port={port}")
+    return subprocess.Popen(cmd, cwd=root, env=env, stdout=subprocess.DEVNULL)
+
+
+def print_report(label: str, rep: Dict[str, Any]):
+    print(f"\n== {label} pattern={rep['pattern']} jobs={rep['jobs']} succeeded={rep['succeeded']} callbacks={rep['callbacks']} bad_sig={rep['bad_signatures']}")
+    print(f"   submit_errors={rep['submit_errors']} get_job_errors={rep['get_job_errors']}")
+    print(f"   throughput={rep['throughput_jobs_per_sec']} jobs/s wall={rep['wall_sec']}s max_queue={rep['max_queue_depth']} saturation={rep['saturation']}")
+    for key in ("submit_latency", "get_job_latency", "loop_lag_healthz", "submit_to_callback", "preview_encode_sec"):
+        print(f"   {key:20s} {rep[key]}")
+
+
+async def main_async(args):
+    receiver = CallbackReceiver(args.callback_host, args.callback_port, args.token)
+    await receiver.start()
+    try:
+        videos = [
+            await make_lavfi_video(args.work_dir, d, args.size, args.fps)
+            for d in args.durations
+        ]
+        os.makedirs(args.out_dir, exist_ok=True)
+        reports = {}
+        if args.spawn_workers:
+            for w in args.spawn_workers:
+                proc = spawn_service(w, args.spawn_port)
+                try:
+                    base_url = f"http://127.0.0.1:{args.spawn_port}"
+                    await wait_healthy(base_url)
+                    receiver.received.clear()
+                    reports[f"workers={w}"] = await run_load(args, base_url, receiver, videos)
+                finally:
+                    proc.terminate()
+                    proc.wait(timeout=15)
+        else:
+            await wait_healthy(args.base_url)
+            reports["external"] = await run_load(args, args.base_url, receiver, videos)
+    finally:
+        await receiver.stop()
+
+    for label, rep in reports.items():
+        print_report(label, rep)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+        print(f"\n[REPORT] {args.json}")
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="ytms HTTP load test with a local callback receiver")
+    p.add_argument("--base-url", default="http://127.0.0.1:8089")
+    p.add_argument("--spawn-workers", type=int, nargs="*", default=None,
+                   help="start a local service per WORKERS value instead of using --base-url")
+    p.add_argument("--spawn-port", type=int, default=8189)
+    p.add_argument("--pattern", choices=["burst", "steady", "ramp"], default="burst")
+    p.add_argument("--jobs", type=int, default=20)
+    p.add_argument("--rate", type=float, default=1.0, help="jobs/s for steady, first-step jobs/s for ramp")
+    p.add_argument("--ramp-step-sec", type=float, default=10.0)
+    p.add_argument("--durations", type=int, nargs="+", default=[30, 120], help="lavfi video lengths, seconds")
+    p.add_argument("--size", default="640x360")
+    p.add_argument("--fps", type=int, default=25)
+    p.add_argument("--preview-clip", action="store_true")
+    p.add_argument("--work-dir", default="/tmp/ytms-loadtest/src")
+    p.add_argument("--out-dir", default="/tmp/ytms-loadtest/out")
+    p.add_argument("--callback-host", default="127.0.0.1")
+    p.add_argument("--callback-port", type=int, default=8190)
+    p.add_argument("--token", default=settings.GLOBAL_AUTH_TOKEN)
+    p.add_argument("--poll-sec", type=float, default=1.0)
+    p.add_argument("--timeout", type=float, default=600.0, help="seconds to wait for callbacks after the last submit")
+    p.add_argument("--json", default=None, help="write full report here")
+    return p.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main_async(parse_args()))
@@ -0,0 +1,192 @@
+import os
+import io
+import json
+import time
+import pstats
+import cProfile
+import resource
+import threading
+import tracemalloc
+from typing import List, Dict, Any, Optional, Callable
+
+
+# process-wide resources; one profiled job owns each at a time, others record "skipped: busy"
+_owner_lock = threading.Lock()
+_stage_owner: Optional[str] = None
+_tracemalloc_owner: Optional[str] = None
+
+
+def rusage_children() -> Dict[str, float]:
+    ru = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {"utime": ru.ru_utime, "stime": ru.ru_stime, "maxrss_kb": ru.ru_maxrss}
+
+
+class JobProfiler:
+    # Only created for profiled jobs; unprofiled jobs pass profiler=None and skip all of this.
+    # Profiling must never fail a job: every hook degrades to a note in summary.json.
+
+    def __init__(self, job_id: str, out_dir: str):
+        self.job_id = job_id
+        self.out_dir = out_dir
+        self.artifacts: Dict[str, str] = {}
+        self.summary: Dict[str, Any] = {"job_id": job_id, "stages_sec": {}}
+        self._stages: Optional[cProfile.Profile] = None
+        self._pack_stats: Optional[pstats.Stats] = None
+        self._tm_peak = -1
+        self._tm_lines: List[str] = []
+        self._t0 = 0.0
+
+
+    def start(self):
+        global _stage_owner
+        os.makedirs(self.out_dir, exist_ok=True)
+        self._t0 = time.perf_counter()
+        with _owner_lock:
+            if _stage_owner is not None:
+                self.summary["event_loop_profile"] = f"skipped: busy (owned by job {_stage_owner})"
+                return
+            _stage_owner = self.job_id
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+            self._stages = prof
+            # extra only: a cProfile on the loop thread sees everything that runs there
+            self.summary["event_loop_profile"] = "event_loop_thread.prof: whole loop thread, includes other jobs and API handlers; see stages_sec for this job"
+        except ValueError as e:
+            self.summary["event_loop_profile"] = f"skipped: {e}"
+            self._release_stage()
+
+
+    def stage_done(self, name: str, seconds: float):
+        # per-job wall time of one pipeline stage; this is the "why is this video slow" answer
+        stages = self.summary["stages_sec"]
+        stages[name] = round(stages.get(name, 0.0) + seconds, 4)
+
+
+    def wrap_pack(self, fn: Callable) -> Callable:
+        def wrapped(*args, **kwargs):
+            rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            traced = self._claim_tracemalloc()
+            prof = cProfile.Profile()
+            try:
+                prof.enable()
+            except ValueError as e:
+                # 3.12+: sys.monitoring allows one active profiler per interpreter
+                self.summary["pack_sprites_profile"] = f"skipped: {e}"
+                prof = None
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                if prof is not None:
+                    prof.disable()
+                    if self._pack_stats is None:
+                        self._pack_stats = pstats.Stats(prof)
+                    else:
+                        self._pack_stats.add(prof)
+                if traced:
+                    self._release_tracemalloc()
+                rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                mem = self.summary.setdefault("pack_maxrss_kb", {
+                    "note": "process high-water mark (ru_maxrss); grows only when a pack call sets a new process peak",
+                    "before_first": rss_before,
+                    "after_last": rss_after,
+                    "max_growth_in_one_call": 0,
+                })
+                mem["after_last"] = rss_after
+                mem["max_growth_in_one_call"] = max(mem["max_growth_in_one_call"], rss_after - rss_before)
+        return wrapped
+
+
+    def _claim_tracemalloc(self) -> bool:
+        global _tracemalloc_owner
+        with _owner_lock:
+            if _tracemalloc_owner is not None or tracemalloc.is_tracing():
+                if self._tm_peak < 0:
+                    self.summary["tracemalloc"] = "skipped: busy"
+                return False
+            _tracemalloc_owner = self.job_id
+        tracemalloc.start()
+        return True
+
+
+    def _release_tracemalloc(self, top: int = 25):
+        global _tracemalloc_owner
+        try:
+            current, peak = tracemalloc.get_traced_memory()
+            if peak > self._tm_peak:
+                snapshot = tracemalloc.take_snapshot()
+                self._tm_peak = peak
+                self._tm_lines = [str(stat) for stat in snapshot.statistics("lineno")[:top]]
+                self.summary["tracemalloc"] = {
+                    "python_heap_peak_bytes_during_pack": peak,
+                    "current_bytes": current,
+                    "note": "process-wide Python allocator only: includes the loop thread and other jobs "
+                            "during the pack call, excludes Pillow image buffers allocated in C",
+                }
+        finally:
+            tracemalloc.stop()
+            with _owner_lock:
+                _tracemalloc_owner = None
+
+
+    def _release_stage(self):
+        global _stage_owner
+        with _owner_lock:
+            if _stage_owner == self.job_id:
+                _stage_owner = None
+
+
+    def record_ffmpeg(self, cmd: list, stderr_txt: str, ru_before: Dict[str, float], ru_after: Dict[str, float]):
+        bench = [ln for ln in stderr_txt.splitlines() if ln.startswith("bench:")]
+        self.summary["ffmpeg"] = {
+            "bench": bench,
+            # RUSAGE_CHILDREN is process-wide; concurrent jobs inflate this delta
+            "rusage_delta": {
+                "utime": round(ru_after["utime"] - ru_before["utime"], 3),
+                "stime": round(ru_after["stime"] - ru_before["stime"], 3),
+            },
+            "children_maxrss_kb": ru_after["maxrss_kb"],
+        }
+        self._write("ffmpeg_benchmark.txt", " ".join(cmd) + "\n\n" + stderr_txt)
+
+
+    def finish(self) -> Dict[str, str]:
+        try:
+            if self._stages is not None:
+                self._stages.disable()
+                self._dump_stats(
+                    self._stages,
+                    "event_loop_thread",
+                    "NOTE: covers the whole event-loop thread (other jobs and API handlers too), not only this job.\n\n",
+                )
+                self._stages = None
+        finally:
+            self._release_stage()
+        if self._pack_stats is not None:
+            self._dump_stats(self._pack_stats, "pack_sprites")
+        if self._tm_peak >= 0:
+            self._write("pack_sprites_tracemalloc.txt", "\n".join([
+                f"python_heap_peak={self._tm_peak} (largest pack call; process-wide, excludes Pillow C buffers)", "",
+            ] + self._tm_lines))
+        self.summary["wall_sec"] = round(time.perf_counter() - self._t0, 3)
+        self._write("summary.json", json.dumps(self.summary, indent=2))
+        print(f"[PROFILE DONE] job_id={self.job_id} dir={self.out_dir} artifacts={sorted(self.artifacts)}")
+        return self.artifacts
+
+
+    def _dump_stats(self, prof, name: str, header: str = ""):
+        stats = prof if isinstance(prof, pstats.Stats) else pstats.Stats(prof)
+        prof_path = os.path.join(self.out_dir, f"{name}.prof")
+        stats.dump_stats(prof_path)
+        self.artifacts[os.path.basename(prof_path)] = prof_path
+        buf = io.StringIO()
+        stats.stream = buf
+        stats.sort_stats("cumulative").print_stats(40)
+        self._write(f"{name}.txt", header + buf.getvalue())
+
+
+    def _write(self, name: str, text: str):
+        path = os.path.join(self.out_dir, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        self.artifacts[name] = path
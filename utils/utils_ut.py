@@ -1,12 +1,18 @@
 import os
 import math
+import json
+import errno
+import time
+import uuid
 import shutil
 import asyncio
-from typing import List, Optional, Dict, Any, Tuple
+import contextlib
+from typing import List, Optional, Dict, Any, Tuple, AsyncIterator
 from PIL import Image
 import httpx
 
 from config import settings
+from utils.profiling_ut import JobProfiler, rusage_children
 
 
 def ensure_dir(p: str):
@@ -112,6 +118,75 @@ def pack_sprites(
 
 
 
+def pack_sprite_sheet(
+    frames: List[bytes],
+    out_path: str,
+    cols: int,
+    rows: int,
+    tile_w: int,
+    tile_h: int,
+    quality: int = 85,
+) -> str:
+    sprite = Image.new("RGB", (cols*tile_w, rows*tile_h), (0, 0, 0))
+    for i, raw in enumerate(frames):
+        img = Image.frombytes("RGB", (tile_w, tile_h), raw)
+        x = (i % cols) * tile_w
+        y = (i // cols) * tile_h
+        sprite.paste(img, (x, y))
+    ensure_dir(os.path.dirname(out_path))
+    sprite.save(out_path, quality=quality, optimize=True)
+    return out_path
+
+
+
+class PreviewSampler:
+    # keeps an evenly spaced subset of the streamed tiles; holds at most 2*target frames
+    def __init__(self, target: int):
+        self.target = max(1, target)
+        self.stride = 1
+        self.seen = 0
+        self.frames: List[bytes] = []
+
+    def add(self, raw: bytes):
+        if self.seen % self.stride == 0:
+            self.frames.append(raw)
+            if len(self.frames) >= 2 * self.target:
+                self.frames = self.frames[::2]
+                self.stride *= 2
+        self.seen += 1
+
+    def pick(self) -> List[bytes]:
+        n = len(self.frames)
+        # fixed stride over the kept frames so the clip advances at a constant rate;
+        # yields between target/2 and target frames spanning the whole video
+        step = math.ceil(n / self.target)
+        return self.frames[::step]
+
+
+
+def encode_preview_clip(
+    frames: List[bytes],
+    out_path: str,
+    tile_w: int,
+    tile_h: int,
+    frame_ms: int,
+    quality: int = 70,
+) -> str:
+    images = [Image.frombytes("RGB", (tile_w, tile_h), raw) for raw in frames]
+    ensure_dir(os.path.dirname(out_path))
+    images[0].save(
+        out_path,
+        format="WEBP",
+        save_all=True,
+        append_images=images[1:],
+        duration=frame_ms,
+        loop=0,
+        quality=quality,
+    )
+    return out_path
+
+
+
 def sec_fmt(s: float) -> str:
     h = int(s // 3600)
     m = int((s % 3600) // 60)
@@ -196,6 +271,163 @@ async def run_ffmpeg_extract_frames(
 
 
 
+async def stream_ffmpeg_frames(
+    src: str,
+    interval_sec: float,
+    tile_w: int,
+    tile_h: int,
+    profiler: Optional[JobProfiler] = None,
+) -> AsyncIterator[bytes]:
+    # raw tiles via pipe: a slow consumer blocks ffmpeg instead of filling a temp dir
+    vf = build_vf_chain(interval_sec, tile_w, tile_h)
+    cmd = [
+        "ffmpeg", "-y",
+        "-i", src,
+        "-loglevel", "error",
+        "-vf", vf,
+        "-f", "rawvideo",
+        "-pix_fmt", "rgb24",
+        "pipe:1",
+    ]
+    if profiler is not None:
+        # bench: lines are logged at info level
+        cmd[cmd.index("-loglevel") + 1] = "info"
+        cmd.insert(1, "-benchmark")
+        ru_before = rusage_children()
+    print("[FFMPEG CMD]", " ".join(cmd))
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    stderr_task = asyncio.create_task(proc.stderr.read())
+    frame_size = tile_w * tile_h * 3
+    try:
+        while True:
+            try:
+                raw = await proc.stdout.readexactly(frame_size)
+            except asyncio.IncompleteReadError:
+                break
+            yield raw
+        await proc.wait()
+        err_txt = (await stderr_task).decode("utf-8", "ignore")
+        if profiler is not None:
+            profiler.record_ffmpeg(cmd, err_txt, ru_before, rusage_children())
+        if proc.returncode != 0:
+            print("[FFMPEG STDERR]", err_txt)
+            raise RuntimeError(f"ffmpeg failed: {err_txt[:500]}")
+        print("[FFMPEG OK] frames streamed")
+    finally:
+        if proc.returncode is None:
+            try:
+                proc.kill()
+            except ProcessLookupError:
+                pass
+            await proc.wait()
+        if not stderr_task.done():
+            stderr_task.cancel()
+
+
+
+async def build_sprites_streaming(
+    src: str,
+    sprites_dir: str,
+    interval_sec: float,
+    cols: int,
+    rows: int,
+    tile_w: int,
+    tile_h: int,
+    quality: int = 85,
+    sampler: Optional[PreviewSampler] = None,
+    profiler: Optional[JobProfiler] = None,
+) -> Tuple[List[str], int]:
+    # decode and encode overlap; at most SPRITE_QUEUE_SIZE sheets wait in memory
+    ensure_dir(sprites_dir)
+    per_sprite = cols * rows
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, settings.SPRITE_QUEUE_SIZE))
+    sprite_paths: List[str] = []
+    total_frames = 0
+    pack = pack_sprite_sheet if profiler is None else profiler.wrap_pack(pack_sprite_sheet)
+
+    async def produce():
+        nonlocal total_frames
+        block: List[bytes] = []
+        sidx = 0
+        # aclosing: on cancel, ffmpeg is killed and reaped before this task finishes
+        async with contextlib.aclosing(stream_ffmpeg_frames(src, interval_sec, tile_w, tile_h, profiler)) as frames:
+            async for raw in frames:
+                block.append(raw)
+                total_frames += 1
+                if sampler is not None:
+                    sampler.add(raw)
+                if len(block) == per_sprite:
+                    await queue.put((sidx, block))
+                    sidx += 1
+                    block = []
+        if block:
+            await queue.put((sidx, block))
+        await queue.put(None)
+
+    async def consume():
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            sidx, block = item
+            out = os.path.join(sprites_dir, f"sprite_{sidx+1:04d}.jpg")
+            await asyncio.to_thread(pack, block, out, cols, rows, tile_w, tile_h, quality)
+            sprite_paths.append(out)
+
+    producer = asyncio.create_task(produce())
+    consumer = asyncio.create_task(consume())
+    try:
+        await asyncio.gather(producer, consumer)
+    except BaseException:
+        producer.cancel()
+        consumer.cancel()
+        await asyncio.gather(producer, consumer, return_exceptions=True)
+        raise
+    print(f"[SPRITES BUILT] count={len(sprite_paths)} frames={total_frames}")
+    return sprite_paths, total_frames
+
+
+
+def publish_file(src: str, dest: str) -> int:
+    # one rename per file; across devices copy next to dest first so readers never see a partial file
+    ensure_dir(os.path.dirname(dest))
+    try:
+        os.replace(src, dest)
+        return 0
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    tmp = f"{dest}.part-{uuid.uuid4().hex[:8]}"
+    try:
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dest)
+    except Exception:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    os.remove(src)
+    return os.path.getsize(dest)
+
+
+
+def publish_outputs(stage_dir: str, out_base: str, rel_paths: List[str], manifest: Dict[str, Any]) -> int:
+    storage_bytes = 0
+    for rel in rel_paths:
+        storage_bytes += publish_file(os.path.join(stage_dir, rel), os.path.join(out_base, rel))
+    manifest_rel = "sprites_manifest.json"
+    manifest_stage = os.path.join(stage_dir, manifest_rel)
+    with open(manifest_stage, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    storage_bytes += publish_file(manifest_stage, os.path.join(out_base, manifest_rel))
+    print(f"[PUBLISH OK] files={len(rel_paths) + 1} out_base={out_base} storage_bytes={storage_bytes}")
+    return storage_bytes
+
+
+
 async def generate_thumbnails_pipeline(
     video_id: str,
     out_base_path: str,
@@ -206,22 +438,71 @@ async def generate_thumbnails_pipeline(
     tile_h: Optional[int],
     cols: Optional[int],
     rows: Optional[int],
+    preview_clip: bool = False,
+    profiler: Optional[JobProfiler] = None,
 ) -> Dict[str, Any]:
     abs_base = out_base_path.rstrip("/")
+    # video_id is client input; keep only a slug of it so the stage dir cannot leave SCRATCH_DIR
+    slug = "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in video_id)[:64]
+    scratch_root = os.path.realpath(settings.SCRATCH_DIR)
+    stage_dir = os.path.join(scratch_root, f"{slug}-{uuid.uuid4().hex}")
+    if os.path.dirname(os.path.realpath(stage_dir)) != scratch_root:
+        raise RuntimeError(f"stage_dir_outside_scratch dir={stage_dir}")
+    try:
+        return await _generate_thumbnails_staged(
+            stage_dir=stage_dir,
+            abs_base=abs_base,
+            src_path=src_path,
+            src_url=src_url,
+            interval_sec=interval_sec,
+            tile_w=tile_w,
+            tile_h=tile_h,
+            cols=cols,
+            rows=rows,
+            preview_clip=preview_clip,
+            profiler=profiler,
+        )
+    finally:
+        shutil.rmtree(stage_dir, ignore_errors=True)
+        print(f"[STAGE CLEANUP] dir={stage_dir}")
+
 
-    sprites_dir = os.path.join(abs_base, "sprites")
-    frames_dir = os.path.join(abs_base, "sprites_frames_tmp")
+
+def _stage_done(profiler: Optional[JobProfiler], name: str, t0: float):
+    if profiler is not None:
+        profiler.stage_done(name, time.perf_counter() - t0)
+
+
+
+async def _generate_thumbnails_staged(
+    stage_dir: str,
+    abs_base: str,
+    src_path: Optional[str],
+    src_url: Optional[str],
+    interval_sec: Optional[float],
+    tile_w: Optional[int],
+    tile_h: Optional[int],
+    cols: Optional[int],
+    rows: Optional[int],
+    preview_clip: bool = False,
+    profiler: Optional[JobProfiler] = None,
+) -> Dict[str, Any]:
+    sprites_dir = os.path.join(stage_dir, "sprites")
     ensure_dir(sprites_dir)
-    ensure_dir(frames_dir)
+    scratch_bytes = 0
 
     source = src_path
     if not source and src_url:
-        source = os.path.join(sprites_dir, "download_source.webm")
+        t0 = time.perf_counter()
+        source = os.path.join(stage_dir, "download_source.webm")
         await download_src(src_url, source)
+        scratch_bytes += os.path.getsize(source)
+        _stage_done(profiler, "download", t0)
 
     if not source or not os.path.exists(source):
         raise RuntimeError(f"source_not_found src={source}")
 
+    t0 = time.perf_counter()
     size_bytes = os.path.getsize(source)
     w0, h0 = await probe_video_dims(source)
     print(f"[SOURCE OK] path={source} size={size_bytes} bytes dims={w0}x{h0}")
@@ -239,6 +520,7 @@ async def generate_thumbnails_pipeline(
         print(f"[ADAPTIVE INTERVAL] duration={dur} chosen={interval_sec}")
     else:
         dur = await probe_duration_sec(source)
+    _stage_done(profiler, "probe", t0)
 
     tw = tile_w or settings.DEFAULT_TILE_W
     th = tile_h or settings.DEFAULT_TILE_H
@@ -253,33 +535,28 @@ async def generate_thumbnails_pipeline(
 
     print(f"[PARAMS] interval={interval_sec} tw={tw} th={th} cols={c} rows={r}")
 
-    await run_ffmpeg_extract_frames(
+    sampler = PreviewSampler(settings.PREVIEW_CLIP_FRAMES) if preview_clip else None
+    t0 = time.perf_counter()
+    sprites, total_frames = await build_sprites_streaming(
         src=source,
-        out_dir=frames_dir,
-        interval_sec=interval_sec,
-        tile_w=tw,
-        tile_h=th,
-    )
-
-    frames = list_frames(frames_dir)
-    print(f"[FRAMES FOUND] count={len(frames)} dir={frames_dir}")
-    if not frames:
-        raise RuntimeError("no_frames_extracted")
-
-    sprites = pack_sprites(
-        frames=frames,
         sprites_dir=sprites_dir,
+        interval_sec=interval_sec,
         cols=c,
         rows=r,
         tile_w=tw,
         tile_h=th,
+        sampler=sampler,
+        profiler=profiler,
     )
+    _stage_done(profiler, "decode_pack", t0)
+    if not total_frames:
+        raise RuntimeError("no_frames_extracted")
 
     vtt_rel = "sprites.vtt"
-    vtt_abs = os.path.join(abs_base, vtt_rel)
+    vtt_stage = os.path.join(stage_dir, vtt_rel)
     write_vtt(
-        vtt_path=vtt_abs,
-        total_frames=len(frames),
+        vtt_path=vtt_stage,
+        total_frames=total_frames,
         interval_sec=interval_sec,
         cols=c,
         rows=r,
@@ -287,24 +564,47 @@ async def generate_thumbnails_pipeline(
         tile_h=th,
     )
 
-    deleted = 0
-    for f in frames:
+    sprite_rels = [f"sprites/{os.path.basename(p)}" for p in sprites]
+    scratch_bytes += sum(os.path.getsize(p) for p in sprites) + os.path.getsize(vtt_stage)
+
+    preview = None
+    preview_error = None
+    if sampler is not None:
+        clip_frames = sampler.pick()
+        preview_rel = "preview.webp"
+        preview_stage = os.path.join(stage_dir, preview_rel)
+        t0 = time.perf_counter()
         try:
-            os.remove(f)
-            deleted += 1
+            await asyncio.to_thread(
+                encode_preview_clip,
+                clip_frames,
+                preview_stage,
+                tw,
+                th,
+                settings.PREVIEW_CLIP_FRAME_MS,
+                settings.PREVIEW_CLIP_QUALITY,
+            )
+            preview_size = os.path.getsize(preview_stage)
         except Exception as e:
-            print("[FRAMES CLEANUP ERROR]", f, e)
-    try:
-        os.rmdir(frames_dir)
-    except Exception:
-        pass
-    print(f"[FRAMES CLEANUP] deleted={deleted} dir_removed={not os.path.exists(frames_dir)}")
+            # optional output: never fail the sprites over it
+            preview_error = str(e) or e.__class__.__name__
+            print(f"[PREVIEW ERROR] path={preview_stage} error={preview_error}")
+            try:
+                os.remove(preview_stage)
+            except OSError:
+                pass
+        else:
+            encode_sec = time.perf_counter() - t0
+            scratch_bytes += preview_size
+            preview = {"path": preview_rel, "size_bytes": preview_size, "frames": len(clip_frames)}
+            print(f"[PREVIEW CLIP] path={preview_stage} frames={len(clip_frames)} size={preview_size} encode_sec={encode_sec:.3f}")
+        _stage_done(profiler, "preview", t0)
 
     result = {
         "vtt": {"path": vtt_rel},
-        "sprites": [{"path": f"sprites/{os.path.basename(p)}"} for p in sprites],
+        "sprites": [{"path": rel} for rel in sprite_rels],
         "meta": {
-            "frames": len(frames),
+            "frames": total_frames,
             "interval": interval_sec,
             "tile_w": tw,
             "tile_h": th,
@@ -314,4 +614,23 @@ async def generate_thumbnails_pipeline(
             "frame_limit": settings.MAX_FRAMES,
         },
     }
+    if preview is not None:
+        result["preview"] = preview
+        result["meta"]["preview_encode_sec"] = round(encode_sec, 3)
+    elif preview_error is not None:
+        result["meta"]["preview_error"] = preview_error
+
+    # sprites first, then the VTT that references them, manifest last
+    published = sprite_rels + ([preview["path"]] if preview else []) + [vtt_rel]
+    t0 = time.perf_counter()
+    storage_bytes = await asyncio.to_thread(publish_outputs, stage_dir, abs_base, published, result)
+    _stage_done(profiler, "publish", t0)
+    # tiers are physical devices: a scratch dir on the storage volume means every byte hit storage
+    same_device = os.stat(stage_dir).st_dev == os.stat(abs_base).st_dev
+    if same_device:
+        print(f"[IO WARNING] SCRATCH_DIR={settings.SCRATCH_DIR} is on the same device as {abs_base}")
+        storage_bytes += scratch_bytes
+        scratch_bytes = 0
+    result["meta"]["io"] = {"scratch_bytes": scratch_bytes, "storage_bytes": storage_bytes, "same_device": same_device}
+    print(f"[IO TIERS] scratch_bytes={scratch_bytes} storage_bytes={storage_bytes} same_device={same_device}")
     return result
\ No newline at end of file